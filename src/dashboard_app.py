@@ -16,21 +16,72 @@ Author: Mohamed Iyed Mokline – ENSAE Paris
 """
 
 import streamlit as st
+import numpy as np
 import pandas as pd
 from datetime import date, timedelta
+from typing import List, Tuple
 import plotly.graph_objects as go
-from plotly.graph_objects import Indicator, Figure
 
 from src.market_stress_engine import (
     DataManager,
     CompositeStress,
-    TICKERS,
-    WEIGHTS,
+    TICKER_LABELS,
+    WEIGHTS_ARR,
     radar_plot
 )
 
 st.markdown("Developed during a front-office trading internship at BIAT (Summer 2025).")
 
+# -----------------------------
+# Cached Computations
+# -----------------------------
+class _IncompleteStress(Exception):
+    """
+    Carries a stress result computed with some tickers missing, so it is shown
+    without being stored by st.cache_data (which never caches a call that raised).
+    """
+    def __init__(self, result: Tuple[float, Tuple[float, ...], float], missing: List[str]) -> None:
+        super().__init__(f"No data for {', '.join(missing)}")
+        self.result = result
+        self.missing = missing
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _compute_stress(start: str, end: str) -> Tuple[float, Tuple[float, ...], float]:
+    """
+    Compute the composite and component stress scores for a date range,
+    plus the previous trading day's composite from the same data.
+    Returns plain floats so Streamlit's cache stays cheap to hash and copy.
+    Raises _IncompleteStress when tickers are missing, so the next rerun fetches again.
+    """
+    dm = DataManager(start, end)
+    stress = CompositeStress(dm)
+    composite, individual = stress.compute()
+    composite_prev, _ = stress.compute(lag=1)
+    result = (float(composite), tuple(float(v) for v in individual), float(composite_prev))
+    if dm.missing:
+        raise _IncompleteStress(result, dm.missing)
+    return result
+
+@st.cache_data(show_spinner=False)
+def _score_table(individual_values: Tuple[float, ...]) -> Tuple[pd.DataFrame, bytes]:
+    """
+    Build the component score table and its CSV export for a set of scores.
+    Cached so download-button reruns skip both the DataFrame build and to_csv.
+    """
+    scores_np = np.round(np.array(individual_values), 2)
+    df = pd.DataFrame(
+        {"Score": scores_np, "Weight": WEIGHTS_ARR, "Weighted Score": scores_np * WEIGHTS_ARR},
+        index=pd.Index(TICKER_LABELS, name="Component")
+    )
+    return df, df.to_csv().encode('utf-8')
+
+@st.fragment
+def _download_button(csv: bytes) -> None:
+    """
+    Render the CSV export button; clicking it reruns only this fragment.
+    """
+    st.download_button("⬇️ Download CSV", csv, "stress_scores.csv", "text/csv")
+
 # -----------------------------
 # Streamlit Page Configuration
 # -----------------------------
@@ -47,9 +98,14 @@ start_date = end_date - timedelta(days=365 * 3)
 # -----------------------------
 # 2. Compute Stress Index
 # -----------------------------
-dm = DataManager(str(start_date), str(end_date))
-stress = CompositeStress(dm)
-composite_val, individual_vals = stress.compute()
+try:
+    composite_val, individual_vals, composite_val_yesterday = _compute_stress(str(start_date), str(end_date))
+except _IncompleteStress as e:
+    composite_val, individual_vals, composite_val_yesterday = e.result
+    st.warning(
+        f"⚠️ No market data for {', '.join(e.missing)}: shown at the neutral score of 50. "
+        "The data will be fetched again on the next refresh."
+    )
 
 # -----------------------------
 # 3. Display Global Stress Metric
@@ -59,71 +115,62 @@ st.metric("Global Stress Index", f"{composite_val:.2f}")
 # -----------------------------
 # 4. Display Component Scores
 # -----------------------------
-df_scores = pd.DataFrame({
-    "Component": list(TICKERS.values()),
-    "Score": [round(val, 2) for val in individual_vals],
-    "Weight": [WEIGHTS[k] for k in TICKERS]
-})
-df_scores["Weighted Score"] = df_scores["Score"] * df_scores["Weight"]
-df_scores.set_index("Component", inplace=True)
-
+df_scores, csv = _score_table(individual_vals)
 st.dataframe(df_scores)
 
 # -----------------------------
 # 5. Export CSV Button
 # -----------------------------
-csv = df_scores.to_csv().encode('utf-8')
-st.download_button("⬇️ Download CSV", csv, "stress_scores.csv", "text/csv")
+_download_button(csv)
 
 # -----------------------------
 # 6. Radar Chart Visualization
 # -----------------------------
-labels = list(TICKERS.values())
-values = individual_vals + [individual_vals[0]]
-labels_closed = labels + [labels[0]]
-
-fig_radar = go.Figure()
-fig_radar.add_trace(go.Scatterpolar(
-    r=values,
-    theta=labels_closed,
-    fill='toself',
-    name='Stress Score',
-    line=dict(color='rgba(192, 57, 43, 1)', width=3),
-    marker=dict(size=8),
-    fillcolor='rgba(192, 57, 43, 0.45)'
-))
-fig_radar.update_layout(
-    polar=dict(
-        radialaxis=dict(visible=True, range=[0, 100]),
-        angularaxis=dict(rotation=90, direction='clockwise')
-    ),
-    title="<b>Component Radar</b>",
-    showlegend=False
-)
-st.plotly_chart(fig_radar, use_container_width=True)
-
-# -----------------------------
-# 7. Compute Previous Day's Index for Delta
-# -----------------------------
-last_business_day = pd.bdate_range(end=pd.to_datetime(end_date), periods=2)[-2]
-yesterday_end_str = last_business_day.strftime('%Y-%m-%d')
-yesterday_start_str = (last_business_day - timedelta(days=365 * 3)).strftime('%Y-%m-%d')
+@st.cache_data(show_spinner=False)
+def _radar_figure() -> dict:
+    """
+    Build the styled component radar chart once, as a figure dict.
+    st.cache_data hands every call its own copy, ready to be filled with scores.
+    """
+    labels = list(TICKER_LABELS)
+    labels_closed = labels + [labels[0]]
+
+    fig = go.Figure()
+    fig.add_trace(go.Scatterpolar(
+        r=[0.0] * len(labels_closed),
+        theta=labels_closed,
+        fill='toself',
+        name='Stress Score',
+        line=dict(color='rgba(192, 57, 43, 1)', width=3),
+        marker=dict(size=8),
+        fillcolor='rgba(192, 57, 43, 0.45)'
+    ))
+    fig.update_layout(
+        polar=dict(
+            radialaxis=dict(visible=True, range=[0, 100]),
+            angularaxis=dict(rotation=90, direction='clockwise')
+        ),
+        title="<b>Component Radar</b>",
+        showlegend=False
+    )
+    return fig.to_dict()
 
-dm_yesterday = DataManager(yesterday_start_str, yesterday_end_str)
-stress_yesterday = CompositeStress(dm_yesterday)
-composite_val_yesterday, _ = stress_yesterday.compute()
+fig_radar = _radar_figure()
+fig_radar["data"][0]["r"] = individual_vals + individual_vals[:1]
+st.plotly_chart(fig_radar, use_container_width=True)
 
 # -----------------------------
-# 8. Gauge Indicator Visualization
+# 7. Gauge Indicator Visualization
 # -----------------------------
-def gauge_plot(value: float, reference_value: float) -> None:
+@st.cache_data(show_spinner=False)
+def _gauge_figure() -> dict:
     """
-    Display a styled gauge chart with current market stress value
-    and comparison to a reference value (typically the previous day).
+    Build the styled gauge chart once, as a figure dict.
+    st.cache_data hands every call its own copy, which gauge_plot fills in.
     """
     fig = go.Figure(go.Indicator(
         mode="gauge+number+delta",
-        value=value,
+        value=0.0,
         title={
             'text': "<span style='font-size:24px; color:white;'><b>Market Stress Index</b></span><br><span style='font-size:16px; color:gray;'>Composite Volatility Tracker</span>",
             'font': {'size': 24}
@@ -133,7 +180,7 @@ def gauge_plot(value: float, reference_value: float) -> None:
             'valueformat': ".2f"
         },
         delta={
-            'reference': reference_value,
+            'reference': 0.0,
             'position': "bottom",
             'increasing': {'color': "#C0392B"},
             'decreasing': {'color': "#27AE60"},
@@ -153,7 +200,7 @@ def gauge_plot(value: float, reference_value: float) -> None:
             'threshold': {
                 'line': {'color': "#000", 'width': 6},
                 'thickness': 0.8,
-                'value': value
+                'value': 0.0
             }
         }
     ))
@@ -164,6 +211,18 @@ def gauge_plot(value: float, reference_value: float) -> None:
         margin=dict(t=80, b=30, l=20, r=20)
     )
 
+    return fig.to_dict()
+
+def gauge_plot(value: float, reference_value: float) -> None:
+    """
+    Display the gauge chart with current market stress value
+    and comparison to a reference value (typically the previous day).
+    """
+    fig = _gauge_figure()
+    indicator = fig["data"][0]
+    indicator["value"] = value
+    indicator["delta"]["reference"] = reference_value
+    indicator["gauge"]["threshold"]["value"] = value
     st.plotly_chart(fig, use_container_width=True)
 
 gauge_plot(composite_val, composite_val_yesterday)
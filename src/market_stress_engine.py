@@ -17,17 +17,14 @@ Author: Mohamed Iyed Mokline – ENSAE Paris
 
 import numpy as np
 import pandas as pd
+import streamlit as st
 import yfinance as yf
+from curl_cffi import requests as curl_requests
 import plotly.graph_objects as go
-import plotly.express as px
-import matplotlib.pyplot as plt
 import datetime
-from datetime import timedelta
-import argparse
 import logging
-from functools import lru_cache
-from math import erf, sqrt
-from typing import Tuple, List
+from scipy.special import ndtr
+from typing import Tuple, List, Union
 import os
 
 # =========================
@@ -65,6 +62,81 @@ WEIGHTS = {
 # Weights reflect perceived relevance in capturing market-wide stress signals.
 # Volatility indexes (VIX, GVZ) given higher weight due to sensitivity to systemic shocks.
 
+# Constant views of the setup above, materialized once instead of on every render
+TICKER_KEYS = tuple(TICKERS)
+TICKER_LABELS = tuple(TICKERS.values())
+WEIGHTS_ARR = np.fromiter((WEIGHTS[k] for k in TICKER_KEYS), dtype=np.float64)
+WEIGHTS_ARR.flags.writeable = False  # shared by every CompositeStress and the dashboard table
+
+
+# =========================
+# DATA FETCHING
+# =========================
+_SESSION = curl_requests.Session(impersonate="chrome")
+# One HTTP session per process: every download reuses its pooled connections across reruns.
+# yfinance only accepts curl_cffi sessions, so a plain requests.Session cannot be passed here.
+
+SUPERSET_DAYS = 365 * 3 + 5
+# Calendar days covered by the shared download: the 3-year window plus a few days of slack
+
+class IncompleteDownloadError(ValueError):
+    def __init__(self, missing: List[str], data: pd.DataFrame) -> None:
+        super().__init__(f"No prices returned for {', '.join(missing)}")
+        self.missing = missing
+        self.data = data
+# Raised when only some tickers came back. Carries the partial frame so callers can still score the
+# good tickers, while st.cache_data (which never stores a call that raised) retries on the next call.
+
+def _yf_download(tickers: Tuple[str, ...], start_date: str, end_date: str) -> pd.DataFrame:
+    return yf.download(
+        list(tickers),
+        start=start_date,
+        end=end_date,
+        group_by="ticker",
+        auto_adjust=True,
+        threads=True,
+        progress=False,
+        session=_SESSION
+    )
+# One batched download for all tickers (yfinance parallelizes the HTTP calls)
+
+def _missing_tickers(data: pd.DataFrame, tickers: Tuple[str, ...]) -> List[str]:
+    if data.empty:
+        return list(tickers)
+    closes = data.xs("Close", axis=1, level=1)
+    return [t for t in tickers if t not in closes or closes[t].isna().all()]
+# yfinance reports a failed ticker as an all-NaN column instead of raising
+
+def _download_history(tickers: Tuple[str, ...], start_date: str, end_date: str) -> pd.DataFrame:
+    data = _yf_download(tickers, start_date, end_date)
+    missing = _missing_tickers(data, tickers)
+    if len(missing) == len(tickers):
+        raise ValueError(f"No data returned from {start_date} to {end_date}")
+
+    if missing:
+        retry = _yf_download(tuple(missing), start_date, end_date)
+        still_missing = _missing_tickers(retry, tuple(missing))
+        recovered = [t for t in missing if t not in still_missing]
+        if recovered:
+            data = pd.concat([data.drop(columns=recovered, level=0, errors="ignore"), retry[recovered]], axis=1)
+        if still_missing:
+            raise IncompleteDownloadError(still_missing, data)
+    return data
+# Tickers missing from the batch are re-fetched once on their own before giving up on them.
+# Raises ValueError when nothing came back and IncompleteDownloadError when some tickers are still missing
+
+def _superset_start(end_date: str) -> pd.Timestamp:
+    return pd.Timestamp(end_date) - pd.Timedelta(days=SUPERSET_DAYS)
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _fetch_superset(end_date: str) -> pd.DataFrame:
+    return _download_history(TICKER_KEYS, _superset_start(end_date).strftime("%Y-%m-%d"), end_date)
+# Cached on the end date only, so every window ending there (3-year or shorter) is a slice of it
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _fetch_history(tickers: Tuple[str, ...], start_date: str, end_date: str) -> pd.DataFrame:
+    return _download_history(tickers, start_date, end_date)
+# Fallback for windows reaching further back than the superset (e.g. a custom CLI start date)
 
 # =========================
 # DATA MANAGER
@@ -73,54 +145,96 @@ class DataManager:
     def __init__(self, start_date: str, end_date: str) -> None:
         self.start_date = start_date
         self.end_date = end_date
+        self.missing: List[str] = []
 
-    @lru_cache(maxsize=32)
-    def get_history(self, ticker: str) -> pd.DataFrame:
+    def _download(self) -> pd.DataFrame:
+        self.missing = []
         try:
-            return yf.Ticker(ticker).history(start=self.start_date, end=self.end_date)
+            use_superset = pd.Timestamp(self.start_date) >= _superset_start(self.end_date)
+            if use_superset:
+                data = _fetch_superset(self.end_date)
+            else:
+                data = _fetch_history(TICKER_KEYS, self.start_date, self.end_date)
+        except IncompleteDownloadError as e:
+            logging.warning("Incomplete history from %s to %s: %s", self.start_date, self.end_date, e)
+            self.missing = e.missing
+            data = e.data
         except Exception as e:
-            logging.error("Error fetching history for %s: %s", ticker, e)
+            logging.error("Error fetching history from %s to %s: %s", self.start_date, self.end_date, e)
+            self.missing = list(TICKER_KEYS)
             return pd.DataFrame()
+        return data.loc[self.start_date:] if use_superset else data
+
+    def get_closes(self) -> pd.DataFrame:
+        data = self._download()
+        if data.empty:
+            return pd.DataFrame(columns=list(TICKER_KEYS), dtype=float)
+        return data.xs("Close", axis=1, level=1).reindex(columns=list(TICKER_KEYS))
+# `missing` lists the tickers without data after the last download; they score a neutral 50
 
 # =========================
-# INDICATOR BASE CLASS
+# HISTORICAL SCALING
 # =========================
-class Indicator:
-    def __init__(self, data_manager: DataManager, ticker: str) -> None:
-        self.dm = data_manager
-        self.ticker = ticker
-
-    def calculate(self) -> float:
-        raise NotImplementedError("Must implement calculate method")
-
-    @staticmethod
-    def scale_with_history(values: np.ndarray, current: float) -> float:
-        values = np.array(values)
-        if len(values) < 10:
-            return 50.0
-        m = np.mean(values)
-        s = np.std(values)
-        if s < 1e-8:
-            return 50.0
+def scale_with_history(values: np.ndarray, current: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+    n = np.sum(~np.isnan(values), axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        m = np.nansum(values, axis=0) / n
+        s = np.sqrt(np.nansum((values - m) ** 2, axis=0) / n)
         z = (current - m) / s
-        sc = 0.5 * (1 + erf(z / sqrt(2))) * 100
-        return max(0, min(100, sc))
+    sc = np.clip(ndtr(z) * 100, 0.0, 100.0)
+    sc = np.where((n < 10) | ~(s >= 1e-8) | np.isnan(current), 50.0, sc)
+    return float(sc) if sc.ndim == 0 else sc
 # Normalizes the current volatility value using a Z-score over historical data
-# Then rescales to 0–100 via Gaussian CDF (erf) → gives a consistent stress level interpretation
+# Then rescales to 0–100 via Gaussian CDF (ndtr) → gives a consistent stress level interpretation
+# Also accepts a (days, assets) matrix with one current value per column and scores them all at once
+# Mean and std come from nansum / n, so empty (all-NaN) columns fall back to 50 without warnings
 
 # =========================
-# VOLATILITY INDICATOR
+# VECTORIZED SCORING
 # =========================
-class VolatilityIndicator(Indicator):
-    def calculate(self) -> float:
-        df = self.dm.get_history(self.ticker)
-        if df.empty or len(df) < 10:
-            return 50.0
-        df["returns"] = df["Close"].pct_change()
-        volatility = df["returns"].rolling(window=10).std() * 100
-        vol_series = volatility.dropna().values
-        current_vol = volatility.iloc[-1]
-        return Indicator.scale_with_history(vol_series, current_vol)
+def _tail_align(columns: List[np.ndarray]) -> np.ndarray:
+    length = max((len(c) for c in columns), default=0)
+    out = np.full((length, len(columns)), np.nan)
+    for j, c in enumerate(columns):
+        if len(c):
+            out[length - len(c):, j] = c
+    return out
+# Stacks per-asset series of different lengths into one matrix, aligned on their last observation.
+# Each asset keeps its own trading calendar, so the last row is every asset's latest value.
+
+def _rolling_std_all(R: np.ndarray, w: int = 10) -> np.ndarray:
+    valid = ~np.isnan(R)
+    S = np.zeros((R.shape[0] + 1, 3, R.shape[1]))
+    np.copyto(S[1:, 0], R, where=valid)
+    np.square(S[1:, 0], out=S[1:, 1])
+    S[1:, 2] = valid
+    np.cumsum(S, axis=0, out=S)
+    window_sum, window_sq, count = np.moveaxis(S[w:] - S[:-w], 1, 0)
+    var = (window_sq - window_sum ** 2 / w) / (w - 1)
+    std = np.sqrt(np.maximum(var, 0.0))
+    return np.where(count == w, std, np.nan)
+# Rolling sample std (ddof=1, like pandas rolling().std()) of every column from running sums:
+# returns, squared returns and valid counts share one buffer, so a single cumsum pass and one
+# difference replace one pandas rolling object per asset.
+# Windows touching the NaN padding of shorter columns come out as NaN.
+
+def volatility_matrix(closes: pd.DataFrame, window: int = 10) -> np.ndarray:
+    c = _tail_align([closes[t].dropna().to_numpy() for t in closes])
+    rets = c[1:] / c[:-1] - 1.0
+    if len(rets) < window:
+        return np.full((0, closes.shape[1]), np.nan)
+    return _rolling_std_all(rets, window) * 100
+# Full 10-day rolling volatility series of every asset, as a (days, assets) matrix
+
+def score_volatility(vol: np.ndarray, lag: int = 0) -> np.ndarray:
+    history = vol[:len(vol) - lag]
+    if len(history) == 0:
+        return np.full(vol.shape[1], 50.0)
+    return scale_with_history(history, history[-1])
+# Scores the volatility observed `lag` days before the last row against the history up to that day,
+# so today's (lag=0) and the previous day's (lag=1) scores come from the same matrix.
+# Every asset is scored in one pass: 10-day rolling volatility, Z-score against its own history,
+# Gaussian CDF rescaled to 0–100
 
 # =========================
 # COMPOSITE STRESS
@@ -128,27 +242,20 @@ class VolatilityIndicator(Indicator):
 class CompositeStress:
     def __init__(self, data_manager: DataManager) -> None:
         self.dm = data_manager
-        self.indicators = [VolatilityIndicator(self.dm, ticker) for ticker in TICKERS]
+        self.weights = WEIGHTS_ARR
+        self.closes = self.dm.get_closes()
+        self._vol = None
 
-    def compute(self) -> Tuple[float, List[float]]:
-        values = []
-        for ind in self.indicators:
-            try:
-                values.append(ind.calculate())
-            except Exception as e:
-                logging.error("Error computing indicator for %s: %s", ind.ticker, e)
-                values.append(50.0)
+    def volatility(self) -> np.ndarray:
+        if self._vol is None:
+            self._vol = volatility_matrix(self.closes)
+        return self._vol
 
-        weights = np.array([WEIGHTS.get(ind.ticker, 0.0) for ind in self.indicators])
-        values_array = np.array(values)
-
-        if weights.sum() > 0:
-            composite = np.average(values_array, weights=weights)
-        else:
-            composite = np.mean(values_array)
-
-        composite = max(0, min(100, composite))
-        return composite, values
+    def compute(self, lag: int = 0) -> Tuple[float, List[float]]:
+        values_array = score_volatility(self.volatility(), lag)
+        composite = float(np.clip(values_array @ self.weights / self.weights.sum(), 0, 100))
+        return composite, values_array.tolist()
+# lag=1 gives the previous trading day's index from the same data, used for the gauge delta
 
 # =========================
 # PLOTLY GAUGE
@@ -201,7 +308,7 @@ def gauge_plot(value: float, reference_value: float) -> None:
 # =========================
 
 def radar_plot(individual_values: List[float]) -> None:
-    labels = list(TICKERS.values())
+    labels = list(TICKER_LABELS)
     values = individual_values + [individual_values[0]]
     labels_closed = labels + [labels[0]]
 
@@ -259,6 +366,8 @@ def radar_plot(individual_values: List[float]) -> None:
 # MAIN FUNCTION
 # =========================
 def main() -> None:
+    import argparse
+
     parser = argparse.ArgumentParser(description="Compute composite market stress indicator.")
     parser.add_argument("--start_date", type=str, default=None, help="Start date in YYYY-MM-DD format")
     parser.add_argument("--end_date", type=str, default=None, help="End date in YYYY-MM-DD format")
@@ -275,18 +384,9 @@ def main() -> None:
     dm = DataManager(start_date, end_date)
     stress = CompositeStress(dm)
     comp_value, individual_values = stress.compute()
+    comp_yesterday, _ = stress.compute(lag=1)
 
-    # Compute the last business day before the end date
-    last_business_day = pd.bdate_range(end=pd.to_datetime(end_date), periods=2)[-2]
-    yesterday_end_str = last_business_day.strftime('%Y-%m-%d')
-    yesterday_start_str = (last_business_day - timedelta(days=365 * 3)).strftime('%Y-%m-%d')
-
-    dm_yesterday = DataManager(yesterday_start_str, yesterday_end_str)
-    stress_yesterday = CompositeStress(dm_yesterday)
-    comp_yesterday, _ = stress_yesterday.compute()
-
-
-    for (symbol, name), val in zip(TICKERS.items(), individual_values):
+    for name, val in zip(TICKER_LABELS, individual_values):
         print(f"{name:30s}: {round(val, 2)}")
     print(f"Composite Market Stress Index: {round(comp_value, 2)}")
 
@@ -296,11 +396,12 @@ def main() -> None:
 
     # Save results to a CSV file
     df_out = pd.DataFrame({
-        "Ticker": list(TICKERS.values()),
+        "Ticker": list(TICKER_LABELS),
         "Stress Score": [round(val, 2) for val in individual_values]
     })
     df_out.loc[len(df_out)] = ["Composite", round(comp_value, 2)]
     df_out.to_csv("market_stress_data.csv", index=False)
     print("✅ Results saved to market_stress_data.csv")
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()